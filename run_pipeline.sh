@@ -1,20 +1,21 @@
 #!/bin/bash
 
+# 1. Convert all PDFs to Markdown in one concurrent LlamaParse run (writes output/{basename}_markdown.md)
+python src/new_document_analysis/llamaparse_converter.py -i input/*.pdf
+
 # Loop over all PDF files in the input directory
 for INPUT_PDF in input/*.pdf; do
   BASENAME=$(basename "$INPUT_PDF" .pdf)
 
-  # 1. Convert PDF to Markdown
-  python src/new_document_analysis/llamaparse_converter.py -i "$INPUT_PDF" -o "output/${BASENAME}_markdown.md"
-
   # 2. Fix Markdown formatting with OpenAI
   python src/new_document_analysis/markdown_fixer.py -i "output/${BASENAME}_markdown.md" -o "output/${BASENAME}_markdown.md"
 
-  # 3. Extract claims from cleaned markdown with OpenAI
-  python src/new_document_analysis/extract_claims.py -i "output/${BASENAME}_markdown.md" -o "output/${BASENAME}_claims.json"
+  # 3. Extract claims from cleaned markdown with OpenAI (in the background, alongside step 4)
+  python src/new_document_analysis/extract_claims.py -i "output/${BASENAME}_markdown.md" -o "output/${BASENAME}_claims.json" &
 
   # 4. Extract metadata from cleaned markdown with OpenAI
   python src/new_document_analysis/extract_metadata.py -i "output/${BASENAME}_markdown.md" -o "output/${BASENAME}_metadata.json"
+  wait
 
   # 5. Compare extracted claims to the database
   python src/new_document_analysis/compare_claims_to_db.py -c "output/${BASENAME}_claims.json" -o "output/${BASENAME}_claim_matches.json"
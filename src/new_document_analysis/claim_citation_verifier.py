@@ -5,6 +5,7 @@ from dotenv import load_dotenv
 import sys
 import re
 import argparse
+from concurrent.futures import ThreadPoolExecutor
 
 # Load environment variables
 load_dotenv()
@@ -14,6 +15,18 @@ PROMPT_PATH = "src/prompts/claim_proposition_citation_check.txt"
 MODEL = "gpt-4.1-mini"
 TEMPERATURE = 0.1
 MAX_TOKENS = 256
+# Maximum number of claims ranked by OpenAI concurrently
+MAX_WORKERS = 8
+
+# Literal Unicode escapes left in LLM output and their character equivalents
+UNICODE_ESCAPES = {
+    "\\u2019": "'",   # Right single quotation mark
+    "\\u2018": "'",   # Left single quotation mark
+    "\\u201c": "\"",  # Left double quotation mark
+    "\\u201d": "\"",  # Right double quotation mark
+}
+UNICODE_ESCAPE_RE = re.compile("|".join(re.escape(escape) for escape in UNICODE_ESCAPES))
+WHITESPACE_RE = re.compile(r'\s+')
 
 
 def load_prompt_template(path):
@@ -26,7 +39,7 @@ def load_claim_matches(path):
 
 def save_claim_matches(path, data):
     with open(path, 'w', encoding='utf-8') as f:
-        json.dump(data, f, indent=2, ensure_ascii=False)
+        f.write(json.dumps(data, indent=2, ensure_ascii=False))
 
 def check_proposition_supports_claim(client, prompt_template, claim, proposition):
     prompt = prompt_template.replace("{{claim}}", claim).replace("{{proposition}}", proposition)
@@ -51,10 +64,17 @@ def check_proposition_supports_claim(client, prompt_template, claim, proposition
         return True, (classification, justification)
     return False, (classification, justification)
 
-def rank_and_annotate_propositions(client, prompt_template, claim, propositions):
+def split_prompt_template(prompt_template):
+    """Split the ranking template once around its {{claim}} and {{propositions}} placeholders."""
+    head, _, rest = prompt_template.partition("{{claim}}")
+    middle, _, tail = rest.partition("{{propositions}}")
+    return head, middle, tail
+
+def rank_and_annotate_propositions(client, prompt_parts, claim, propositions):
     # Format the propositions as a numbered list for the prompt
     prop_list = "\n".join([f"{i+1}. {p}" for i, p in enumerate(propositions)])
-    prompt = prompt_template.replace("{{claim}}", claim).replace("{{propositions}}", prop_list)
+    head, middle, tail = prompt_parts
+    prompt = f"{head}{claim}{middle}{prop_list}{tail}"
     response = client.chat.completions.create(
         model=MODEL,
         messages=[{"role": "user", "content": prompt}],
@@ -77,32 +97,45 @@ def rank_and_annotate_propositions(client, prompt_template, claim, propositions)
 
 def normalize_text(text):
     """Normalize text to improve matching by removing Unicode escapes, etc."""
-    # Replace Unicode escapes with their character equivalents
-    text = text.replace("\\u2019", "'")  # Right single quotation mark
-    text = text.replace("\\u2018", "'")  # Left single quotation mark
-    text = text.replace("\\u201c", "\"")  # Left double quotation mark
-    text = text.replace("\\u201d", "\"")  # Right double quotation mark
+    # Replace Unicode escapes with their character equivalents in a single pass
+    if "\\u" in text:
+        text = UNICODE_ESCAPE_RE.sub(lambda m: UNICODE_ESCAPES[m.group(0)], text)
     # Remove extra whitespace
-    text = re.sub(r'\s+', ' ', text).strip()
-    return text
+    return WHITESPACE_RE.sub(' ', text).strip()
+
+def prepare_match_candidates(matches):
+    """Normalize each match's proposition once so it can be reused for every ranked proposition."""
+    # Exact matches after normalization are resolved by lookup; the first match wins
+    exact_index = {}
+    candidates = []
+    for match in matches:
+        normalized_db_prop = normalize_text(match.get("db_propositions", ""))
+        exact_index.setdefault(normalized_db_prop, match)
+        candidates.append((normalized_db_prop, set(normalized_db_prop), match))
+    return exact_index, candidates
 
-def find_best_match(proposition, matches):
+def find_best_match(proposition, prepared_matches):
     """Find the best matching original proposition using fuzzy matching."""
+    exact_index, candidates = prepared_matches
     normalized_prop = normalize_text(proposition)
+    # Check for exact match after normalization
+    exact_match = exact_index.get(normalized_prop)
+    if exact_match is not None:
+        return exact_match
     best_match = None
     highest_similarity = 0
     
-    for match in matches:
-        db_prop = match.get("db_propositions", "")
-        normalized_db_prop = normalize_text(db_prop)
-        
-        # Check for exact match after normalization
-        if normalized_prop == normalized_db_prop:
-            return match
+    for normalized_db_prop, db_chars, match in candidates:
+        # The overlap can never exceed len(normalized_prop), so skip candidates
+        # whose best possible score cannot beat the threshold or the current best
+        longest = max(len(normalized_prop), len(normalized_db_prop))
+        if len(normalized_prop) <= max(highest_similarity, 0.8) * longest:
+            continue
         
-        # Calculate similarity (simple character overlap for now)
-        common_chars = sum(1 for c in normalized_prop if c in normalized_db_prop)
-        similarity = common_chars / max(len(normalized_prop), len(normalized_db_prop))
+        # Calculate similarity (simple character overlap for now); membership is
+        # tested against the set of characters, counted without a Python-level loop
+        common_chars = sum(map(db_chars.__contains__, normalized_prop))
+        similarity = common_chars / longest
         
         if similarity > highest_similarity and similarity > 0.8:  # 80% threshold
             highest_similarity = similarity
@@ -130,23 +163,41 @@ def main():
         print("Error: Please set the OPENAI_API_KEY environment variable.", file=sys.stderr)
         return 1
     client = openai.OpenAI(api_key=api_key)
-    prompt_template = load_prompt_template(PROMPT_PATH)
+    prompt_parts = split_prompt_template(load_prompt_template(PROMPT_PATH))
     claim_matches = load_claim_matches(args.input)
     print("\n===== Starting Claim Proposition Ranking =====\n")
-    for idx, entry in enumerate(claim_matches):
+
+    def rank_request(request):
+        claim, propositions = request
+        if not propositions:
+            return []
+        return rank_and_annotate_propositions(client, prompt_parts, claim, list(propositions))
+
+    # Claims repeated with the same candidate propositions share a single ranking call
+    requests = [
+        (entry.get("claim", ""), tuple(m.get("db_propositions", "") for m in entry.get("matches", [])))
+        for entry in claim_matches
+    ]
+    unique_requests = list(dict.fromkeys(requests))
+
+    # Rank every distinct claim concurrently; each is an independent OpenAI round-trip
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+        ranked_by_request = dict(zip(unique_requests, executor.map(rank_request, unique_requests)))
+    rankings = [ranked_by_request[request] for request in requests]
+
+    for idx, (entry, ranked) in enumerate(zip(claim_matches, rankings)):
         claim = entry.get("claim", "")
         matches = entry.get("matches", [])
-        propositions = [m.get("db_propositions", "") for m in matches]
         print(f"\n--- Claim {idx+1}/{len(claim_matches)} ---\n{claim}\n{'-'*40}")
-        if not propositions:
+        if not matches:
             entry["ranked_propositions"] = []
             continue
-        ranked = rank_and_annotate_propositions(client, prompt_template, claim, propositions)
         # Attach the original match metadata to the ranked output
+        prepared_matches = prepare_match_candidates(matches)
         ranked_with_ids = []
         for r in ranked:
             # Find the original match for this proposition using improved matching
-            match = find_best_match(r["proposition"], matches)
+            match = find_best_match(r["proposition"], prepared_matches)
             
             if match:
                 ranked_with_ids.append({
@@ -12,13 +12,15 @@ args = parser.parse_args()
 
 # Determine base name
 if args.metadata is None:
-    import glob
-    meta_files = glob.glob('output/*.json')
-    meta_files = [f for f in meta_files if not f.endswith('_claim_matches.json') and not f.endswith('_claims.json')]
-    if meta_files:
-        metadata_path = meta_files[0]
-    else:
-        metadata_path = 'output/metadata.json'
+    # Take the first metadata-looking JSON in output/, stopping at the first hit
+    metadata_path = 'output/metadata.json'
+    if os.path.isdir('output'):
+        with os.scandir('output') as entries:
+            metadata_path = next(
+                (entry.path for entry in entries
+                 if entry.name.endswith('.json') and not entry.name.startswith('.')
+                 and not entry.name.endswith(('_claim_matches.json', '_claims.json'))),
+                metadata_path)
 else:
     metadata_path = args.metadata
 base_name = os.path.splitext(os.path.basename(metadata_path))[0]
@@ -86,10 +88,6 @@ for idx, claim_entry in enumerate(claim_matches, 1):
         md_lines.append("- No propositions found\n")
     md_lines.append("\n---\n")
 
-# Write to markdown file
-with open(output_md_path, 'w', encoding='utf-8') as f:
-    f.write('\n'.join(md_lines))
-
 # Add references section
 references_lines = []
 references_lines.append("\n## References\n")
@@ -105,8 +103,10 @@ for idx, claim_entry in enumerate(claim_matches, 1):
                     references_lines.append(f"- *[{match_id}] {file_name}*")
                 else:
                     references_lines.append(f"- [{match_id}] {file_name}")
-if references_lines:
-    with open(output_md_path, 'a', encoding='utf-8') as f:
-        f.write('\n'.join(references_lines))
+
+# Write the report and references section in a single pass
+with open(output_md_path, 'w', encoding='utf-8') as f:
+    f.write('\n'.join(md_lines))
+    f.write('\n'.join(references_lines))
 
 print(f"Markdown file generated at {output_md_path}") 
\ No newline at end of file
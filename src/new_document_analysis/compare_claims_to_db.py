@@ -4,39 +4,76 @@ import torch
 import torch.nn.functional as F
 from transformers import AutoTokenizer, AutoModel
 import argparse
+import glob
 import sys
 import os
 import pandas as pd
 
+# Parsed embedding matrices are cached next to the database CSV under this suffix
+EMBEDDINGS_CACHE_SUFFIX = '.embeddings.npy'
+# Number of claims embedded per forward pass
+BATCH_SIZE = 32
+
 # --- Embedding and similarity functions (adapted from QueryJson.py) ---
 def mean_pooling(model_output, attention_mask):
     token_embeddings = model_output[0]
-    input_mask_expanded = attention_mask.unsqueeze(-1).expand(token_embeddings.size()).float()
-    return torch.sum(token_embeddings * input_mask_expanded, 1) / torch.clamp(input_mask_expanded.sum(1), min=1e-9)
-
-def create_embedding(text, model, tokenizer, max_length, prefix, device):
-    prefixed_text = f"{prefix} {text}"
-    inputs = tokenizer(
-        [prefixed_text],
-        padding=True,
-        truncation=True,
-        max_length=max_length,
-        return_tensors='pt'
-    ).to(device)
-    with torch.no_grad():
-        outputs = model(**inputs)
-    embedding = mean_pooling(outputs, inputs['attention_mask'])
-    embedding = F.normalize(embedding, p=2, dim=1)
-    return embedding.cpu().numpy()[0]
-
-def find_similar_propositions(query_embedding, db_embeddings, db_propositions, threshold=0.5, top_k=4):
-    similarities = np.dot(db_embeddings, query_embedding)
+    # Contract the [B, L] mask against [B, L, D] in one batched matmul in fp32, so
+    # half-precision model outputs are summed without overflow or precision loss
+    summed = torch.einsum('bld,bl->bd', token_embeddings.float(), attention_mask.float())
+    counts = attention_mask.sum(1, keepdim=True).float()
+    return summed / torch.clamp(counts, min=1e-9)
+
+def create_embeddings(texts, model, tokenizer, max_length, prefix, device, batch_size=BATCH_SIZE):
+    """Embed texts in padded minibatches, one forward pass per batch."""
+    # Batch texts of similar length together so little compute is spent on padding;
+    # character length is a free proxy for token length
+    order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+    batches = []
+    for start in range(0, len(order), batch_size):
+        prefixed_texts = [f"{prefix} {texts[i]}" for i in order[start:start + batch_size]]
+        inputs = tokenizer(
+            prefixed_texts,
+            padding=True,
+            truncation=True,
+            max_length=max_length,
+            return_tensors='pt'
+        ).to(device)
+        with torch.inference_mode():
+            outputs = model(**inputs)
+            embeddings = mean_pooling(outputs, inputs['attention_mask'])
+            embeddings = F.normalize(embeddings, p=2, dim=1)
+        batches.append(embeddings.cpu().numpy())
+    if not batches:
+        return np.empty((0, 0), dtype=np.float32)
+    # Scatter the length-sorted rows back into input order
+    sorted_embeddings = np.concatenate(batches)
+    embeddings = np.empty_like(sorted_embeddings)
+    embeddings[order] = sorted_embeddings
+    return embeddings
+
+def compute_similarity_matrix(query_embeddings, db_embeddings, device):
+    """Cosine similarities of every query against every database row, on the GPU when available."""
+    if len(query_embeddings) == 0:
+        return np.empty((0, len(db_embeddings)), dtype=np.float32)
+    if device.type == 'cuda':
+        with torch.inference_mode():
+            query_tensor = torch.tensor(query_embeddings, dtype=torch.float32, device=device)
+            db_tensor = torch.tensor(db_embeddings, dtype=torch.float32, device=device)
+            return (query_tensor @ db_tensor.T).cpu().numpy()
+    return np.ascontiguousarray(query_embeddings, dtype=np.float32) @ db_embeddings.T
+
+def find_similar_propositions(similarities, db_propositions, threshold=0.5, top_k=4):
+    """Select the best matches for one claim from its row of the similarity matrix."""
     matching_indices = np.where(similarities >= threshold)[0]
     if len(matching_indices) == 0:
-        top_indices = np.argsort(similarities)[-top_k:][::-1]
-    else:
-        sorted_indices = matching_indices[np.argsort(similarities[matching_indices])[::-1]]
-        top_indices = sorted_indices[:top_k]
+        # Nothing clears the threshold: fall back to the best entries overall
+        matching_indices = np.arange(len(similarities))
+    if 0 < top_k < len(matching_indices):
+        # Select the top_k candidates in linear time, then sort only those
+        partitioned = np.argpartition(-similarities[matching_indices], top_k - 1)[:top_k]
+        matching_indices = matching_indices[partitioned]
+    sorted_indices = matching_indices[np.argsort(similarities[matching_indices])[::-1]]
+    top_indices = sorted_indices[:top_k]
     results = []
     for idx in top_indices:
         if 'db_proposition' in db_propositions[idx]:
@@ -49,14 +86,74 @@ def find_similar_propositions(query_embedding, db_embeddings, db_propositions, t
         results.append({
             'db_propositions': proposition_text,
             'id': db_propositions[idx]['id'],
-            'similarity': float(similarities[idx])
+            'similarity': float(similarities[idx]),
+            'file_name': db_propositions[idx].get('file_name', '')
         })
     return results
 
+def parse_database_embeddings(embedding_column):
+    """Parse the CSV's stringified embedding vectors into a normalized float32 matrix."""
+    # Rows are parsed in C by np.fromstring and written straight into a preallocated matrix
+    db_embeddings = None
+    for row, emb_str in enumerate(embedding_column):
+        try:
+            if isinstance(emb_str, str):
+                emb = np.fromstring(emb_str.strip('[]'), sep=',', dtype=np.float32)
+            else:
+                emb = np.asarray(emb_str, dtype=np.float32)
+            if db_embeddings is None:
+                db_embeddings = np.empty((len(embedding_column), emb.shape[0]), dtype=np.float32)
+            # Reject rows that would otherwise broadcast into the matrix or poison the cache
+            if emb.shape != db_embeddings.shape[1:]:
+                raise ValueError(f"row {row} has shape {emb.shape}, expected {db_embeddings.shape[1:]}")
+            if not np.isfinite(emb).all():
+                raise ValueError(f"row {row} contains non-finite values")
+            db_embeddings[row] = emb
+        except Exception as e:
+            print(f"Error parsing embedding: {e}", file=sys.stderr)
+            return None
+    if db_embeddings is None:
+        return np.empty((0, 0), dtype=np.float32)
+    return normalize_rows(db_embeddings)
+
+def normalize_rows(embeddings):
+    """L2-normalize rows into a C-contiguous float32 matrix so a plain dot product is cosine similarity."""
+    norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+    return np.ascontiguousarray(embeddings / np.clip(norms, 1e-9, None), dtype=np.float32)
+
+def embeddings_cache_path(csv_path):
+    return os.path.splitext(csv_path)[0] + EMBEDDINGS_CACHE_SUFFIX
+
+def fresh_embeddings_cache(csv_path):
+    """Return the cached embedding matrix path if it exists and is at least as new as the CSV."""
+    cache_path = embeddings_cache_path(csv_path)
+    if os.path.exists(cache_path) and os.path.getmtime(cache_path) >= os.path.getmtime(csv_path):
+        return cache_path
+    return None
+
+def save_embeddings_cache(csv_path, db_embeddings):
+    """Store the parsed matrix next to the CSV so later runs can skip parsing."""
+    cache_path = embeddings_cache_path(csv_path)
+    try:
+        np.save(cache_path, db_embeddings)
+    except OSError as e:
+        print(f"Warning: could not write embeddings cache {cache_path}: {e}", file=sys.stderr)
+
 def load_database_embeddings(csv_path):
     print(f"Loading database embeddings from {csv_path}...", file=sys.stderr)
     try:
-        df = pd.read_csv(csv_path)
+        # Parsing thousands of stringified vectors dominates load time, so reuse the last parse.
+        # With a fresh cache the embeddings column is skipped and the matrix is memory-mapped.
+        db_embeddings = None
+        cache_path = fresh_embeddings_cache(csv_path)
+        if cache_path:
+            df = pd.read_csv(csv_path, usecols=lambda col: col != 'embeddings')
+            db_embeddings = np.load(cache_path, mmap_mode='r')
+            if db_embeddings.shape[0] != len(df):
+                print(f"Warning: {cache_path} does not match the database; re-parsing embeddings", file=sys.stderr)
+                db_embeddings = None
+        if db_embeddings is None:
+            df = pd.read_csv(csv_path)
         required_columns = ['text', 'embeddings', 'id']
         missing_columns = [col for col in required_columns if col not in df.columns]
         if missing_columns:
@@ -65,41 +162,25 @@ def load_database_embeddings(csv_path):
             if 'text' not in df.columns:
                 print("Error: 'text' column must exist in database", file=sys.stderr)
                 return None, None
-            if 'embeddings' not in df.columns:
+            if 'embeddings' not in df.columns and db_embeddings is None:
                 print("Error: 'embeddings' column must exist in database", file=sys.stderr)
                 return None, None
-        embeddings_list = []
-        for emb_str in df['embeddings']:
-            try:
-                if isinstance(emb_str, str):
-                    values = emb_str.strip('[]').split(',')
-                    emb = np.array([float(x.strip()) for x in values])
-                    embeddings_list.append(emb)
-                else:
-                    embeddings_list.append(np.array(emb_str))
-            except Exception as e:
-                print(f"Error parsing embedding: {e}", file=sys.stderr)
+        if db_embeddings is None:
+            db_embeddings = parse_database_embeddings(df['embeddings'])
+            if db_embeddings is None:
                 return None, None
-        db_embeddings = np.array(embeddings_list)
-        db_propositions = []
-        for i, row in df.iterrows():
-            prop_dict = {'id': row['id']}
-            if 'text' in row:
-                prop_dict['db_proposition'] = row['text']
-            elif 'cleanText' in row:
-                prop_dict['db_proposition'] = row['cleanText']
-            elif 'Text' in row:
-                prop_dict['db_proposition'] = row['Text']
-            else:
-                text_columns = [col for col in row.index if isinstance(row[col], str) and col not in ['id', 'embeddings']]
-                if text_columns:
-                    prop_dict['db_proposition'] = row[text_columns[0]]
-                else:
-                    prop_dict['db_proposition'] = f"Row {i}"
-            # Add file_name if present
-            if 'file_name' in row:
-                prop_dict['file_name'] = row['file_name']
-            db_propositions.append(prop_dict)
+            save_embeddings_cache(csv_path, db_embeddings)
+        # Build the proposition records from whole columns rather than one Series per row;
+        # 'text' is guaranteed by the check above
+        ids = df['id'].tolist()
+        texts = df['text'].tolist()
+        if 'file_name' in df.columns:
+            db_propositions = [
+                {'id': prop_id, 'db_proposition': text, 'file_name': file_name}
+                for prop_id, text, file_name in zip(ids, texts, df['file_name'].tolist())
+            ]
+        else:
+            db_propositions = [{'id': prop_id, 'db_proposition': text} for prop_id, text in zip(ids, texts)]
         return db_embeddings, db_propositions
     except Exception as e:
         print(f"Error loading database: {e}", file=sys.stderr)
@@ -115,13 +196,15 @@ def main():
     parser.add_argument('--threshold', type=float, default=0.6, help='Similarity threshold (default: 0.6)')
     parser.add_argument('--top_k', type=int, default=3, help='Number of top matches to return (default: 3)')
     parser.add_argument('--max_length', type=int, default=512, help='Maximum token length for embeddings (default: 512)')
+    parser.add_argument('--batch_size', type=int, default=BATCH_SIZE, help=f'Number of claims embedded per forward pass (default: {BATCH_SIZE})')
     parser.add_argument('--use_gpu', action='store_true', help='Use GPU if available')
     parser.add_argument('--no_gpu', action='store_true', help='Disable GPU usage even if available')
+    parser.add_argument('--num_threads', type=int, default=None, help='CPU threads for the embedding model (default: torch\'s choice, capped at the CPUs available to this process)')
+    parser.add_argument('--compile', action='store_true', help='Compile the embedding model with torch.compile (pays off on large claim sets)')
     args = parser.parse_args()
 
     # Determine base name
     if args.claims is None:
-        import glob
         claim_files = glob.glob('output/*_claims.json')
         if claim_files:
             claims_path = claim_files[0]
@@ -144,13 +227,27 @@ def main():
         use_gpu = False
     device = torch.device('cuda' if use_gpu and torch.cuda.is_available() else 'cpu')
     print(f"Using device: {device}", file=sys.stderr)
+    if device.type == 'cpu':
+        if args.num_threads:
+            torch.set_num_threads(args.num_threads)
+        elif hasattr(os, 'sched_getaffinity'):
+            # torch defaults to the physical core count; keep that, but never exceed the
+            # CPUs this process may actually run on (cpuset/container limits)
+            torch.set_num_threads(min(torch.get_num_threads(), len(os.sched_getaffinity(0))))
 
     # Load model and tokenizer
     print("Loading model and tokenizer...", file=sys.stderr)
     tokenizer = AutoTokenizer.from_pretrained("nomic-ai/nomic-embed-text-v2-moe", revision="main")
     model = AutoModel.from_pretrained("nomic-ai/nomic-embed-text-v2-moe", revision="main", trust_remote_code=True)
     model = model.to(device)
+    if device.type == 'cuda':
+        # Half precision halves memory traffic; cosine rankings are unaffected at this precision.
+        # bf16 keeps fp32's exponent range, so prefer it where the GPU supports it.
+        model = model.to(torch.bfloat16 if torch.cuda.is_bf16_supported() else torch.float16)
     model.eval()
+    if args.compile:
+        # Padded batch shapes vary, so compile for dynamic shapes rather than recompiling per length
+        model = torch.compile(model, dynamic=True)
 
     # Load claims
     with open(claims_path, 'r', encoding='utf-8') as f:
@@ -167,35 +264,37 @@ def main():
         print("Failed to load database embeddings. Exiting.", file=sys.stderr)
         sys.exit(1)
 
-    # For each claim, compute embedding and find matches
+    # Embed every claim up front in padded minibatches instead of one forward pass per claim
+    claim_texts = [claim.get('sourceText', '') for claim in claims]
+    claim_texts = [text for text in claim_texts if text]
+    # Claims repeated verbatim are embedded and scored once, then shared by row index
+    unique_texts = list(dict.fromkeys(claim_texts))
+    row_of_text = {text: row for row, text in enumerate(unique_texts)}
+    print(f"Embedding {len(unique_texts)} unique claims in batches of {args.batch_size}...", file=sys.stderr)
+    query_embeddings = create_embeddings(
+        texts=unique_texts,
+        model=model,
+        tokenizer=tokenizer,
+        max_length=args.max_length,
+        prefix=args.prefix,
+        device=device,
+        batch_size=args.batch_size
+    )
+
+    # Score every claim against the database in one matrix product rather than one dot per claim
+    similarity_matrix = compute_similarity_matrix(query_embeddings, db_embeddings, device)
+
+    # For each claim, find matches
     results = []
-    for idx, claim in enumerate(claims):
-        text = claim.get('sourceText', '')
-        if not text:
-            continue
-        print(f"Processing claim {idx+1}/{len(claims)}", file=sys.stderr)
-        query_embedding = create_embedding(
-            text=text,
-            model=model,
-            tokenizer=tokenizer,
-            max_length=args.max_length,
-            prefix=args.prefix,
-            device=device
-        )
+    for idx, text in enumerate(claim_texts):
+        print(f"Processing claim {idx+1}/{len(claim_texts)}", file=sys.stderr)
+        similarities = similarity_matrix[row_of_text[text]]
         matches = find_similar_propositions(
-            query_embedding=query_embedding,
-            db_embeddings=db_embeddings,
+            similarities=similarities,
             db_propositions=db_propositions,
             threshold=args.threshold,
             top_k=args.top_k
         )
-        # Add file_name to each match if present in db_propositions
-        for match in matches:
-            match_id = match.get('id')
-            for db_prop in db_propositions:
-                if db_prop.get('id') == match_id:
-                    match['file_name'] = db_prop.get('file_name', '')
-                    break
         results.append({
             'claim': text,
             'matches': matches
@@ -203,7 +302,7 @@ def main():
 
     # Write output
     with open(output_json, 'w', encoding='utf-8') as f:
-        json.dump(results, f, indent=2)
+        f.write(json.dumps(results, indent=2))
     print(f"Wrote results to {output_json}", file=sys.stderr)
 
 if __name__ == "__main__":
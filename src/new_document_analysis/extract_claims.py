@@ -1,21 +1,35 @@
 import json
 from openai import OpenAI
 from dotenv import load_dotenv
+from concurrent.futures import ThreadPoolExecutor
 import argparse
+import glob
 import os
 import sys
 
+# Chunking and reply caching shared with markdown_fixer
+from pipeline_utils import cache_path, split_markdown, write_cache
+
 load_dotenv()
 
+MODEL = "gpt-4.1-mini"
+
+# Documents longer than this are split into chunks whose claims are extracted concurrently
+MAX_CHUNK_CHARS = 40000
+# Maximum number of claim-extraction requests in flight at once
+MAX_WORKERS = 4
+
 parser = argparse.ArgumentParser(description="Extract claims from markdown using OpenAI.")
 parser.add_argument('-i', '--input', default=None, help='Input cleaned markdown file (default: output/{basename}_cleaned.md)')
 parser.add_argument('-o', '--output', default=None, help='Output file path (default: output/{basename}_claims.json)')
+parser.add_argument('--cache_dir', default='.cache/extract_claims', help='Directory for caching replies by prompt hash (default: .cache/extract_claims)')
+parser.add_argument('--no_cache', action='store_true', help='Always call OpenAI, bypassing the reply cache')
 args = parser.parse_args()
+cache_dir = None if args.no_cache else args.cache_dir
 
 # Determine base name
 if args.input is None:
     # Try to find a cleaned markdown file in output/
-    import glob
     md_files = glob.glob('output/*_cleaned.md')
     if md_files:
         input_md = md_files[0]
@@ -35,43 +49,98 @@ print(f"BASENAME:{base_name}", file=sys.stderr)
 with open('src/prompts/extract_claims_prompt.txt', 'r') as f:
     prompt_template = f.read()
 
+# Split the template once around its placeholder so the document is spliced in directly
+if '{text}' not in prompt_template:
+    print("Error: extraction prompt is missing the {text} placeholder.", file=sys.stderr)
+    sys.exit(1)
+prompt_prefix, _, prompt_suffix = prompt_template.partition('{text}')
+
 # Read the cleaned markdown content
 with open(input_md, 'r') as f:
     markdown_content = f.read()
 
-# Insert the markdown content into the prompt
-prompt = prompt_template.replace('{text}', markdown_content)
+def write_reply_cache(cache_file, raw):
+    """Store a reply that parsed as JSON; failures only cost a future cache miss."""
+    try:
+        json.loads(raw)
+    except json.JSONDecodeError:
+        return
+    write_cache(cache_file, raw)
 
-# Call the OpenAI API
-client = OpenAI()
-response = client.chat.completions.create(
-    model="gpt-4.1-mini",
-    messages=[{"role": "user", "content": prompt}],
-    temperature=0.1,
-    max_tokens=32768,
-)
-
-# Parse the response (should be a JSON array)
-claims_json = response.choices[0].message.content.strip()
+def extract_claims_json(text):
+    """Send one piece of markdown to OpenAI and return the raw JSON reply."""
+    # Insert the markdown content into the prompt
+    prompt = prompt_prefix + text + prompt_suffix
+    # Unchanged documents (or chunks) reuse the stored reply instead of a new round-trip
+    cache_file = cache_path(cache_dir, ".json", MODEL, prompt)
+    if cache_file and os.path.isfile(cache_file):
+        with open(cache_file, 'r', encoding='utf-8') as f:
+            cached = f.read()
+        try:
+            json.loads(cached)
+        except json.JSONDecodeError:
+            # A corrupt entry is treated as a miss and overwritten below
+            print(f"Warning: Ignoring unreadable cache file '{cache_file}'.", file=sys.stderr)
+        else:
+            print(f"Using cached claims from '{cache_file}'.", file=sys.stderr)
+            return cached
+    response = client.chat.completions.create(
+        model=MODEL,
+        messages=[{"role": "user", "content": prompt}],
+        temperature=0.1,
+        max_tokens=32768,
+    )
+    # Parse the response (should be a JSON array)
+    raw = clean_json_markdown_wrapping(response.choices[0].message.content.strip())
+    if cache_file:
+        write_reply_cache(cache_file, raw)
+    return raw
 
 def clean_json_markdown_wrapping(text):
-    lines = text.strip().splitlines()
-    if lines and lines[0].strip().startswith("```"):
-        lines = lines[1:]
-    if lines and lines[-1].strip() == "```":
-        lines = lines[:-1]
-    return "\n".join(lines)
+    # Slice off the code fences in place rather than splitting the whole reply into lines
+    text = text.strip()
+    if text.startswith("```"):
+        first_newline = text.find("\n")
+        text = text[first_newline + 1:] if first_newline != -1 else ""
+    last_newline = text.rfind("\n")
+    if text[last_newline + 1:].strip() == "```":
+        text = text[:max(last_newline, 0)]
+    return text
 
-raw = clean_json_markdown_wrapping(claims_json)
-claims = json.loads(raw)
+# Call the OpenAI API, fanning large documents out over concurrent chunk requests
+client = OpenAI()
+chunks = split_markdown(markdown_content, MAX_CHUNK_CHARS)
+if len(chunks) <= 1:
+    raw = extract_claims_json(markdown_content)
+    claims = json.loads(raw)
+else:
+    print(f"Input is {len(markdown_content)} characters; extracting claims from {len(chunks)} chunks...", file=sys.stderr)
+    with ThreadPoolExecutor(max_workers=min(MAX_WORKERS, len(chunks))) as executor:
+        chunk_replies = list(executor.map(extract_claims_json, chunks))
+    # Merge in document order, dropping claims repeated across chunks
+    claims = []
+    seen = set()
+    for index, reply in enumerate(chunk_replies, 1):
+        try:
+            chunk_claims = json.loads(reply)
+        except json.JSONDecodeError as e:
+            print(f"Warning: Skipping chunk {index}; its reply is not valid JSON: {e}", file=sys.stderr)
+            continue
+        if not isinstance(chunk_claims, list):
+            print(f"Warning: Skipping chunk {index}; its reply is not a JSON array of claims.", file=sys.stderr)
+            continue
+        for claim in chunk_claims:
+            # Claims without source text cannot be matched across chunks, so they are always kept
+            key = " ".join(str(claim.get('sourceText') or '').lower().split()) if isinstance(claim, dict) else ''
+            if key:
+                if key in seen:
+                    continue
+                seen.add(key)
+            claims.append(claim)
+    raw = json.dumps(claims, indent=2)
 
 # Write to output file
 with open(output_json, 'w') as f:
     f.write(raw)
 
-print(f"Extraction complete. Results written to {output_json}.")
-
-with open(output_json, 'r', encoding='utf-8') as f:
-    raw = f.read()
-    raw = clean_json_markdown_wrapping(raw)
-    claims = json.loads(raw) 
\ No newline at end of file
+print(f"Extraction complete. Results written to {output_json}.") 
\ No newline at end of file
@@ -4,30 +4,40 @@ import re
 import openai
 from dotenv import load_dotenv
 import argparse
+import glob
 import sys
 
 # Load environment variables from .env file
 load_dotenv()
 
+# Leading run of digits in a file stem, used as the File ID when present
+LEADING_DIGITS_RE = re.compile(r'^\s*(\d+)')
+# Punctuation stripped from content before it is used as a fallback File ID
+NON_WORD_RE = re.compile(r'[^\w\s]')
+# Outermost {...} span in an LLM reply
+JSON_OBJECT_RE = re.compile(r'(\{.*\})', re.DOTALL)
+# Repairs for common JSON mistakes: bare keys and bare word values
+UNQUOTED_KEY_RE = re.compile(r"([{,]\s*)(\w+)\s*:")
+UNQUOTED_VALUE_RE = re.compile(r":\s*(\w+)\s*([,}])")
+# Prompt instruction for the file name field, which is filled in locally instead
+FILENAME_INSTRUCTION_RE = re.compile(r'1\. File name:.*?\n2\.', re.DOTALL)
+
 class MetadataExtractor:
     def __init__(self, api_key):
         self.api_key = api_key
         self.client = openai.OpenAI(api_key=api_key) if api_key else openai.OpenAI()
 
-    def extract_filename(self, markdown_file, markdown_content):
+    def extract_filename(self, file_stem, markdown_content):
         """Extract a filename based on either first numbers or first 10 characters"""
-        # Remove file extension from the original filename
-        basename = os.path.splitext(os.path.basename(markdown_file))[0]
-        
-        # Look for numbers at the beginning of the content
-        number_match = re.search(r'^\s*(\d+)', basename)
+        # Look for numbers at the beginning of the file stem (name without extension)
+        number_match = LEADING_DIGITS_RE.match(file_stem)
         if number_match:
             # Use the first numbers as the filename
             return number_match.group(1)
         else:
             # Use the first 10 characters (or less if content is shorter)
             # Clean the text by removing whitespace and special characters
-            cleaned_text = re.sub(r'[^\w\s]', '', markdown_content.strip())
+            cleaned_text = NON_WORD_RE.sub('', markdown_content.strip())
             return cleaned_text[:10] if len(cleaned_text) >= 10 else cleaned_text
 
     def create_template_json(self):
@@ -60,7 +70,7 @@ class MetadataExtractor:
             print(f"JSON decode error: {error_message}")
             
             # Check if we have actual JSON content
-            json_match = re.search(r'(\{.*\})', json_string, re.DOTALL)
+            json_match = JSON_OBJECT_RE.search(json_string)
             if json_match:
                 # Extract just the JSON part
                 json_string = json_match.group(1)
@@ -68,11 +78,11 @@ class MetadataExtractor:
             
             # Try to fix unquoted keys
             if "Expecting property name enclosed in double quotes" in error_message:
-                json_string = re.sub(r"([{,]\s*)(\w+)\s*:", r'\1"\2":', json_string)
+                json_string = UNQUOTED_KEY_RE.sub(r'\1"\2":', json_string)
                 print("Fixed unquoted keys")
             
             # Fix missing quotes around string values
-            json_string = re.sub(r":\s*(\w+)\s*([,}])", r': "\1"\2', json_string)
+            json_string = UNQUOTED_VALUE_RE.sub(r': "\1"\2', json_string)
             print("Fixed unquoted values")
             
             # Remove control characters and other problematic chars
@@ -91,13 +101,15 @@ class MetadataExtractor:
 
     def process_markdown_file(self, markdown_file, output_file, prompt):
         """Process a single markdown file and convert it to JSON"""
+        # Strip the directory and extension once; reused below and in the error path
+        file_stem = os.path.splitext(os.path.basename(markdown_file))[0]
         try:
             # Read the Markdown file
             with open(markdown_file, 'r', encoding='utf-8') as f:
                 markdown_content = f.read()
                 
             # Extract filename according to the specified pattern
-            file_name = self.extract_filename(markdown_file, markdown_content)
+            file_name = self.extract_filename(file_stem, markdown_content)
             print(f"Extracted file name: {file_name}")
                 
             # Create output directory if it doesn't exist
@@ -112,7 +124,7 @@ class MetadataExtractor:
             # Add the file name that we extracted
             new_data = {
                 "File ID": file_name,
-                "File name": os.path.splitext(os.path.basename(markdown_file))[0]
+                "File name": file_stem
             }
 
             # Merge the existing data into the new object
@@ -121,8 +133,7 @@ class MetadataExtractor:
             # Replace the original data with the new data
             data = new_data
             # Save the JSON data to a file
-            with open(output_file, 'w', encoding='utf-8') as outfile:
-                json.dump(data, outfile, indent=4)
+            self.write_json(output_file, data)
 
             print(f"Successfully converted {markdown_file} to {output_file}")
             
@@ -133,16 +144,21 @@ class MetadataExtractor:
             
             # Create a minimal JSON with just the filename
             data = self.create_template_json()
-            data["File name"] = os.path.splitext(os.path.basename(markdown_file))[0]
+            data["File name"] = file_stem
             
-            with open(output_file, 'w', encoding='utf-8') as outfile:
-                json.dump(data, outfile, indent=4)
+            self.write_json(output_file, data)
             print(f"Created template JSON for {markdown_file} due to error")
 
+    def write_json(self, output_file, data):
+        """Serialize the metadata in one go and write it with a single call"""
+        serialized = json.dumps(data, indent=4)
+        with open(output_file, 'w', encoding='utf-8') as outfile:
+            outfile.write(serialized)
+
     def _prepare_enhanced_prompt(self, prompt):
         """Prepare an enhanced prompt for better JSON generation"""
         # Remove the file name field instruction from the prompt
-        prompt_without_filename = re.sub(r'1\. File name:.*?\n2\.', '2.', prompt, flags=re.DOTALL)
+        prompt_without_filename = FILENAME_INSTRUCTION_RE.sub('2.', prompt)
         # Add explicit JSON formatting instructions
         return prompt_without_filename + "\n\nIMPORTANT: Your response must be valid JSON and nothing else. Do not include any text before or after the JSON object. Do not include code block backticks or any other formatting. Your response must start with { and end with } and be a valid parseable JSON object."
 
@@ -159,7 +175,7 @@ class MetadataExtractor:
             openai_output = response.choices[0].message.content
             
             # Try to find a JSON object in the response
-            json_match = re.search(r'(\{.*\})', openai_output, re.DOTALL)
+            json_match = JSON_OBJECT_RE.search(openai_output)
             if json_match:
                 openai_output = json_match.group(1)
                 print("Extracted JSON object from response")
@@ -204,7 +220,7 @@ class MetadataExtractor:
                     print("Successfully parsed JSON on retry")
                 except:
                     # Try to extract and fix
-                    json_match = re.search(r'(\{.*\})', retry_output, re.DOTALL)
+                    json_match = JSON_OBJECT_RE.search(retry_output)
                     if json_match:
                         extracted = json_match.group(1)
                         data = self.fix_json(extracted)
@@ -230,7 +246,6 @@ def main():
     args = parser.parse_args()
     # Determine base name
     if args.input is None:
-        import glob
         md_files = glob.glob('output/*_cleaned.md')
         if md_files:
             input_md = md_files[0]
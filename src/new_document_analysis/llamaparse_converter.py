@@ -4,10 +4,10 @@ os.environ["PYTHONWARNINGS"] = "ignore"
 
 # Now import everything else
 import argparse
+import asyncio
 import zipfile
 import tempfile
 import shutil
-import glob
 import nest_asyncio
 import warnings
 import sys
@@ -19,6 +19,8 @@ try:
     from dotenv import load_dotenv
 except ImportError:
     print("Warning: dotenv module not found. Skipping .env file loading.", file=sys.stderr)
+    def load_dotenv(*args, **kwargs):
+        return False
 from llama_cloud_services import LlamaParse
 from llama_index.core import SimpleDirectoryReader
 
@@ -28,6 +30,9 @@ nest_asyncio.apply()
 # Additional warning suppression for any warnings that might come later
 warnings.filterwarnings("ignore")
 
+# File extensions handed to LlamaParse, in the order they are preferred inside a ZIP
+SUPPORTED_EXTENSIONS = (".pdf", ".docx", ".doc", ".pptx", ".ppt", ".html")
+
 def process_and_output(document, output_path):
     """
     Process a single document and output its content to the specified path or stdout.
@@ -60,6 +65,94 @@ def process_and_output(document, output_path):
         print(f"Error processing or writing document: {e}", file=sys.stderr)
         return False
 
+def write_chunks(stream, content_chunks):
+    """
+    Write document chunks to a stream, separated by horizontal rules.
+    """
+    for i, content in enumerate(content_chunks):
+        if i:
+            stream.write("\n\n---\n\n")
+        stream.write(content)
+
+def convert_files(input_paths, file_extractor, num_workers):
+    """
+    Parse several documents concurrently with LlamaParse and write each one
+    to output/{basename}_markdown.md.
+    """
+    supported_paths = []
+    # Skipped inputs count as failures, matching the single-file path's exit status
+    failures = 0
+    for path in input_paths:
+        _, file_extension = os.path.splitext(path)
+        if not os.path.isfile(path):
+            print(f"Error: Input path '{path}' is not a valid file. Skipping.", file=sys.stderr)
+            failures += 1
+        elif file_extension.lower() not in file_extractor:
+            print(f"Error: File '{path}' has an unsupported extension ('{file_extension}'). Skipping.", file=sys.stderr)
+            failures += 1
+        else:
+            supported_paths.append(path)
+    if not supported_paths:
+        print("No supported files to process.", file=sys.stderr)
+        return 1
+
+    print(f"Processing {len(supported_paths)} files concurrently...", file=sys.stderr)
+    failures += asyncio.run(aconvert_files(supported_paths, file_extractor, num_workers))
+
+    print("Script finished successfully." if not failures else f"Script finished with {failures} failed files.", file=sys.stderr)
+    return 1 if failures else 0
+
+async def aconvert_files(input_paths, file_extractor, num_workers):
+    """
+    Submit one LlamaParse job per file and write each output as soon as its
+    job finishes, so a slow document does not hold back the others.
+    At most num_workers jobs are in flight at once to stay within the API's
+    rate limits. Returns the number of files that failed.
+    """
+    semaphore = asyncio.Semaphore(num_workers)
+
+    async def parse_one(path):
+        _, file_extension = os.path.splitext(path)
+        try:
+            async with semaphore:
+                return path, await file_extractor[file_extension.lower()].aload_data(path)
+        except Exception as e:
+            print(f"Error parsing '{path}': {e}", file=sys.stderr)
+            return path, None
+
+    failures = 0
+    for next_done in asyncio.as_completed([parse_one(path) for path in input_paths]):
+        path, documents = await next_done
+        if documents is None:
+            failures += 1
+            continue
+        try:
+            saved = save_documents(path, documents)
+        except Exception as e:
+            print(f"Error saving output for '{path}': {e}", file=sys.stderr)
+            saved = False
+        if not saved:
+            failures += 1
+    return failures
+
+def save_documents(input_path, documents):
+    """
+    Write the parsed chunks of one input file to output/{basename}_markdown.md.
+    """
+    base_name = os.path.splitext(os.path.basename(input_path))[0]
+    output_path = f"output/{base_name}_markdown.md"
+    print(f"BASENAME:{base_name}", file=sys.stderr)
+    print(f"LlamaParse extracted {len(documents)} document chunks from '{input_path}'.", file=sys.stderr)
+    content_chunks = [content for content in (doc.get_content() for doc in documents) if content]
+    if not content_chunks:
+        print(f"Error: No content extracted from '{input_path}'.", file=sys.stderr)
+        return False
+    os.makedirs(os.path.dirname(output_path), exist_ok=True)
+    with open(output_path, 'w', encoding='utf-8', buffering=1 << 20) as f:
+        write_chunks(f, content_chunks)
+    print(f"Successfully saved combined content to '{output_path}'.", file=sys.stderr)
+    return True
+
 def main():
     """
     Main function to handle argument parsing, LlamaParse initialization, 
@@ -68,13 +161,20 @@ def main():
     
     # --- Argument Parsing ---
     cli_parser = argparse.ArgumentParser(description="Convert a document to Markdown using LlamaParse.")
-    cli_parser.add_argument("-i", "--input", default="-", 
-                         help="Path to the input file. Use '-' for stdin (default).")
+    cli_parser.add_argument("-i", "--input", nargs="+", default=["-"], 
+                         help="Path to the input file. Use '-' for stdin (default). Several files may be given "
+                              "to parse them in one batch; each is written to output/{basename}_markdown.md.")
     cli_parser.add_argument("-o", "--output", default=None, 
                          help="Path to output file. If not specified, will use output/{basename}_cleaned.md.")
+    cli_parser.add_argument("--num_workers", type=int, default=4,
+                         help="Maximum number of concurrent LlamaParse parse jobs (default: 4).")
     args = cli_parser.parse_args()
 
-    input_path = args.input
+    input_paths = args.input
+    if len(input_paths) > 1 and (args.output or '-' in input_paths):
+        print("Error: --output and stdin input are only supported with a single input file.", file=sys.stderr)
+        return 1
+    input_path = input_paths[0]
     # Determine base name for output
     if input_path == '-' or not os.path.isfile(input_path):
         base_name = 'input'
@@ -84,8 +184,11 @@ def main():
     if not output_path:
         output_path = f"output/{base_name}_markdown.md"
 
-    print(f"Script started. Input: {input_path}, Output: {output_path}", file=sys.stderr)
-    print(f"BASENAME:{base_name}", file=sys.stderr)
+    if len(input_paths) == 1:
+        print(f"Script started. Input: {input_path}, Output: {output_path}", file=sys.stderr)
+        print(f"BASENAME:{base_name}", file=sys.stderr)
+    else:
+        print(f"Script started. Inputs: {len(input_paths)} files, Output: output/", file=sys.stderr)
 
     # --- API Key Loading ---
     load_dotenv()
@@ -99,7 +202,7 @@ def main():
     else:
         # Mask the API key for security but show enough to verify it's correct
         masked_key = api_key[:4] + "*" * (len(api_key) - 8) + api_key[-4:] if len(api_key) > 8 else "****"
-        print(f"Using API key starting with {api_key[0:]}", file=sys.stderr)
+        print(f"Using API key {masked_key}", file=sys.stderr)
 
 
     # --- LlamaParse Initialization ---
@@ -108,22 +211,24 @@ def main():
         parser = LlamaParse(
             api_key=api_key,
             result_type="markdown",  # Explicitly set to markdown
+            num_workers=args.num_workers,  # Bound concurrent parse jobs sent to the API
             verbose=True             # Enable verbose output for debugging
         )
         # Define the file extractor for SimpleDirectoryReader
-        file_extractor = {
-            ".pdf": parser,
-            ".docx": parser,
-            ".doc": parser,
-            ".pptx": parser,
-            ".ppt": parser,
-            ".html": parser
-        }
+        file_extractor = dict.fromkeys(SUPPORTED_EXTENSIONS, parser)
         print("LlamaParse initialized successfully.", file=sys.stderr)
     except Exception as e:
         print(f"Error initializing LlamaParse: {e}", file=sys.stderr)
         return 1 # Exit if initialization fails
 
+    # --- Batch Input Handling ---
+    if len(input_paths) > 1:
+        try:
+            return convert_files(input_paths, file_extractor, args.num_workers)
+        except Exception as e:
+            print(f"An unexpected error occurred during batch processing: {e}", file=sys.stderr)
+            return 1
+
     # --- Input Handling ---
     documents = []
     temp_dir = None # To keep track of temporary directory for stdin or zip files
@@ -161,19 +266,27 @@ def main():
                 print(f"Processing ZIP archive: {input_path}", file=sys.stderr)
                 if not temp_dir:  # Create temp dir if not already created for stdin
                     temp_dir = tempfile.mkdtemp()
-                print(f"Extracting ZIP contents to temporary directory: {temp_dir}", file=sys.stderr)
-                with zipfile.ZipFile(input_path, 'r') as zip_ref:
-                    zip_ref.extractall(temp_dir)
-                
-                # Get the first supported file from the ZIP
-                supported_extensions = tuple(file_extractor.keys())
+                # Only the first supported file is parsed, so pick it from the archive
+                # index and extract that single entry instead of the whole archive.
                 extracted_files = []
-                for ext in supported_extensions:
-                    # Use '*' before extension to match filenames like 'file.pdf'
-                    extracted_files.extend(glob.glob(os.path.join(temp_dir, '**', f'*{ext}'), recursive=True))
+                with zipfile.ZipFile(input_path, 'r') as zip_ref:
+                    candidates = [
+                        info for info in zip_ref.infolist()
+                        if not info.is_dir() and not info.filename.startswith('__MACOSX/')
+                    ]
+                    for ext in SUPPORTED_EXTENSIONS:
+                        member = next((info for info in candidates if info.filename.lower().endswith(ext)), None)
+                        if member is not None:
+                            break
+                    if member is not None:
+                        first_file = os.path.join(temp_dir, os.path.basename(member.filename))
+                        print(f"Extracting '{member.filename}' to temporary directory: {temp_dir}", file=sys.stderr)
+                        with zip_ref.open(member) as src, open(first_file, 'wb') as dst:
+                            shutil.copyfileobj(src, dst, length=1 << 20)
+                        extracted_files.append(first_file)
 
                 if not extracted_files:
-                    print(f"Error: No supported files ({', '.join(supported_extensions)}) found in the ZIP archive.", file=sys.stderr)
+                    print(f"Error: No supported files ({', '.join(SUPPORTED_EXTENSIONS)}) found in the ZIP archive.", file=sys.stderr)
                     return 1
                 else:
                     # Take just the first file
@@ -184,7 +297,7 @@ def main():
                     print(f"LlamaParse extracted {len(documents)} document chunks from ZIP file.", file=sys.stderr)
             else:
                 print(f"Error: File '{input_path}' has an unsupported extension ('{file_extension}').", file=sys.stderr)
-                print(f"Supported extensions are: {', '.join(file_extractor.keys())} and .zip", file=sys.stderr)
+                print(f"Supported extensions are: {', '.join(SUPPORTED_EXTENSIONS)} and .zip", file=sys.stderr)
                 return 1 # Exit for unsupported file types
         else:
             print(f"Error: Input path '{input_path}' is not a valid file.", file=sys.stderr)
@@ -192,26 +305,25 @@ def main():
 
         # --- Process and Output ---
         if documents:
-            # Combine all document chunks into a single markdown document
-            all_content = ""
+            # Collect the non-empty document chunks
+            content_chunks = []
+            num_documents = len(documents)
             
-            # Iterate through all document chunks and combine
+            # Iterate through all document chunks and collect their content
             for i, doc in enumerate(documents):
                 try:
                     content = doc.get_content()
                     if content:
-                        # Add a separator between chunks if not the first chunk
-                        if all_content:
-                            all_content += "\n\n---\n\n"
-                        all_content += content
-                        print(f"Added content from chunk {i+1}/{len(documents)}", file=sys.stderr)
-                except Exception as e:
-                    print(f"Error processing chunk {i+1}/{len(documents)}: {e}", file=sys.stderr)
+                        content_chunks.append(content)
+                        print(f"Added content from chunk {i+1}/{num_documents}", file=sys.stderr)
+                except (AttributeError, ValueError) as e:
+                    print(f"Error processing chunk {i+1}/{num_documents}: {e}", file=sys.stderr)
             
-            # Output the combined content
-            if all_content:
+            # Output the combined content, streaming chunk by chunk so the whole
+            # document is never materialized as one string
+            if content_chunks:
                 if output_path == '-':
-                    sys.stdout.write(all_content)
+                    write_chunks(sys.stdout, content_chunks)
                 else:
                     # Ensure directory exists
                     output_dir = os.path.dirname(output_path)
@@ -219,8 +331,8 @@ def main():
                         os.makedirs(output_dir, exist_ok=True)
                         
                     # Write the file
-                    with open(output_path, 'w', encoding='utf-8') as f:
-                        f.write(all_content)
+                    with open(output_path, 'w', encoding='utf-8', buffering=1 << 20) as f:
+                        write_chunks(f, content_chunks)
                     print(f"Successfully saved combined content to '{output_path}'.", file=sys.stderr)
             else:
                 print("Error: No content extracted from documents.", file=sys.stderr)
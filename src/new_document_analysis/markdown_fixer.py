@@ -1,16 +1,33 @@
 import os
-import re
 import sys
+import argparse
 from dotenv import load_dotenv
 import openai
+from concurrent.futures import ThreadPoolExecutor
+
+# Chunking and reply caching shared with extract_claims
+from pipeline_utils import cache_path, split_markdown, write_cache
 
 # Load environment variables from .env file
 load_dotenv()
 
+MODEL = "gpt-4.1-mini"
+
+# Documents longer than this are cleaned in chunks so the reply fits in max_tokens
+MAX_CHUNK_CHARS = 40000
+# Inputs shorter than this are passed through without an OpenAI round-trip
+MIN_CONTENT_CHARS = 200
+# Maximum number of chunks sent to OpenAI concurrently
+MAX_WORKERS = 4
+
 class MarkdownFixer:
-    def __init__(self, api_key):
+    def __init__(self, api_key, cache_dir=None):
         self.api_key = api_key
+        # Directory of cleaned outputs keyed by input hash; None disables the cache
+        self.cache_dir = cache_dir
         self.client = openai.OpenAI(api_key=api_key) if api_key else openai.OpenAI()
+        # Prompt templates pre-split around the {markdown_content} placeholder
+        self._prompt_parts = {}
     
     def read_file(self, filepath):
         """Reads content from a file."""
@@ -20,7 +37,7 @@ class MarkdownFixer:
         except FileNotFoundError:
             print(f"Error: Input file not found at '{filepath}'", file=sys.stderr)
             return None
-        except Exception as e:
+        except (OSError, UnicodeDecodeError) as e:
             print(f"Error reading file '{filepath}': {e}", file=sys.stderr)
             return None
 
@@ -34,7 +51,7 @@ class MarkdownFixer:
                 f.write(content)
             print(f"Successfully wrote cleaned markdown to '{filepath}'", file=sys.stderr)
             return True
-        except Exception as e:
+        except OSError as e:
             print(f"Error writing file '{filepath}': {e}", file=sys.stderr)
             return False
 
@@ -46,34 +63,55 @@ class MarkdownFixer:
         except FileNotFoundError:
             print(f"Error: Prompt template file not found at '{prompt_path}'", file=sys.stderr)
             return None
-        except Exception as e:
+        except (OSError, UnicodeDecodeError) as e:
             print(f"Error reading prompt template '{prompt_path}': {e}", file=sys.stderr)
             return None
 
     def create_prompt(self, markdown_content, prompt_template):
         """Creates the prompt for the LLM using a template."""
-        return prompt_template.replace("{markdown_content}", markdown_content)
+        parts = self._prompt_parts.get(prompt_template)
+        if parts is None:
+            parts = self._prompt_parts[prompt_template] = prompt_template.split("{markdown_content}", 1)
+        if len(parts) == 1:
+            return prompt_template
+        return parts[0] + markdown_content + parts[1]
 
     def fix_markdown_with_openai(self, markdown_content, prompt_template):
-        """Sends the markdown to OpenAI for fixing and returns the cleaned version."""
+        """Sends the markdown to OpenAI for fixing and returns (cleaned version, whether every reply was complete)."""
         if not self.api_key:
             print("Error: OPENAI_API_KEY environment variable not set.", file=sys.stderr)
-            return None
+            return None, False
+        chunks = split_markdown(markdown_content, MAX_CHUNK_CHARS)
+        if len(chunks) <= 1:
+            return self._fix_chunk(markdown_content, prompt_template)
+        print(f"Input is {len(markdown_content)} characters; cleaning it in {len(chunks)} chunks...", file=sys.stderr)
+        with ThreadPoolExecutor(max_workers=min(MAX_WORKERS, len(chunks))) as executor:
+            results = list(executor.map(lambda chunk: self._fix_chunk(chunk, prompt_template), chunks))
+        if any(cleaned is None for cleaned, _ in results):
+            print("Error: One or more chunks could not be cleaned.", file=sys.stderr)
+            return None, False
+        return "\n\n".join(cleaned.strip() for cleaned, _ in results), all(complete for _, complete in results)
+
+    def _fix_chunk(self, markdown_content, prompt_template):
+        """Sends a single piece of markdown to OpenAI and returns (cleaned version, whether the reply was complete)."""
         try:
             prompt = self.create_prompt(markdown_content, prompt_template)
-            print("Sending request to OpenAI gpt-4.1-mini...", file=sys.stderr)
+            print(f"Sending request to OpenAI {MODEL}...", file=sys.stderr)
             response = self.client.chat.completions.create(
-                model="gpt-4.1-mini",
+                model=MODEL,
                 messages=[{"role": "user", "content": prompt}],
                 temperature=0.1,
                 max_tokens=32768,
             )
-            cleaned_markdown = response.choices[0].message.content
+            choice = response.choices[0]
             print("Received response from OpenAI.", file=sys.stderr)
-            return cleaned_markdown
+            complete = choice.finish_reason != "length"
+            if not complete:
+                print("Warning: OpenAI reply was cut off at max_tokens.", file=sys.stderr)
+            return choice.message.content, complete
         except Exception as e:
             print(f"An error occurred while interacting with OpenAI: {e}", file=sys.stderr)
-            return None
+            return None, False
 
     def process_markdown_content(self, markdown_content, prompt_template):
         """Process markdown content and fix its formatting"""
@@ -81,16 +119,28 @@ class MarkdownFixer:
             if not markdown_content:
                 print("Input content is empty. Exiting.", file=sys.stderr)
                 return None
-            print(f"Attempting to fix formatting using OpenAI (Model: gpt-4.1-mini)...", file=sys.stderr)
-            cleaned_markdown = self.fix_markdown_with_openai(markdown_content, prompt_template)
+            if len(markdown_content.strip()) < MIN_CONTENT_CHARS:
+                print(f"Input is shorter than {MIN_CONTENT_CHARS} characters. Using original content.", file=sys.stderr)
+                return markdown_content
+            cached_path = cache_path(self.cache_dir, ".md", MODEL, prompt_template, markdown_content)
+            if cached_path and os.path.isfile(cached_path):
+                cached_markdown = self.read_file(cached_path)
+                if cached_markdown:
+                    print(f"Using cached cleaned markdown from '{cached_path}'.", file=sys.stderr)
+                    return cached_markdown
+            print(f"Attempting to fix formatting using OpenAI (Model: {MODEL})...", file=sys.stderr)
+            cleaned_markdown, complete = self.fix_markdown_with_openai(markdown_content, prompt_template)
             if not cleaned_markdown:
                 print("OpenAI did not return valid content.", file=sys.stderr)
                 return None
-            if cleaned_markdown.strip() != markdown_content.strip():
-                return cleaned_markdown
-            else:
+            # Exact comparison first: it needs no copies, unlike strip() on both documents
+            if cleaned_markdown == markdown_content or cleaned_markdown.strip() == markdown_content.strip():
                 print("OpenAI returned content identical to the input (or only whitespace changes). Using original content.", file=sys.stderr)
-                return markdown_content
+                cleaned_markdown = markdown_content
+            # A truncated reply is still returned, but not cached, so the next run retries it
+            if cached_path and complete:
+                write_cache(cached_path, cleaned_markdown)
+            return cleaned_markdown
         except Exception as e:
             print(f"An error occurred: {e}", file=sys.stderr)
             return None
@@ -101,7 +151,6 @@ def main():
     if not api_key:
         print("Error: Please set the OPENAI_API_KEY environment variable.", file=sys.stderr)
         return 1
-    import argparse
     parser = argparse.ArgumentParser(description="Clean up Markdown formatting issues using OpenAI gpt-4.1-mini.")
     parser.add_argument("-i", "--input", default="-", 
                       help="Input Markdown file path. Use '-' for stdin (default)")
@@ -109,6 +158,10 @@ def main():
                       help="Output file path. If not specified, will use output/{basename}_cleaned.md")
     parser.add_argument("--prompt", default="src/prompts/markdown_prompt.txt", 
                       help="Path to the prompt template file (default: src/prompts/markdown_prompt.txt)")
+    parser.add_argument("--cache_dir", default=".cache/markdown_fixer",
+                      help="Directory for caching cleaned output by input hash (default: .cache/markdown_fixer)")
+    parser.add_argument("--no_cache", action="store_true",
+                      help="Always call OpenAI, bypassing the output cache")
     args = parser.parse_args()
     # Determine base name for output
     if args.input == '-' or not os.path.isfile(args.input):
@@ -119,7 +172,7 @@ def main():
     if not output_path:
         output_path = f"output/{base_name}_cleaned.md"
     print(f"BASENAME:{base_name}", file=sys.stderr)
-    fixer = MarkdownFixer(api_key)
+    fixer = MarkdownFixer(api_key, cache_dir=None if args.no_cache else args.cache_dir)
     print(f"Reading prompt template from: {args.prompt}", file=sys.stderr)
     prompt_template = fixer.read_prompt_template(args.prompt)
     if not prompt_template:
@@ -0,0 +1,85 @@
+import os
+import re
+import sys
+import hashlib
+import tempfile
+
+# Markdown heading line
+HEADING_RE = re.compile(r'#{1,6}\s')
+# Opening or closing line of a fenced code block
+FENCE_RE = re.compile(r' {0,3}(`{3,}|~{3,})')
+
+def split_outside_fences(markdown_content, is_boundary):
+    """Splits text before every line where is_boundary(previous_line, line) holds, never inside a code fence."""
+    sections = []
+    current = []
+    fence = None
+    previous = ''
+    for line in markdown_content.splitlines(keepends=True):
+        if fence is None and current and is_boundary(previous, line):
+            sections.append("".join(current))
+            current = []
+        match = FENCE_RE.match(line)
+        if match:
+            marker = match.group(1)
+            if fence is None:
+                fence = marker
+            elif marker.startswith(fence) and not line[match.end():].strip():
+                fence = None
+        current.append(line)
+        previous = line
+    if current:
+        sections.append("".join(current))
+    return sections
+
+def split_markdown(markdown_content, max_chars):
+    """Splits markdown into chunks of at most max_chars, breaking on headings, then blank lines."""
+    pieces = []
+    for section in split_outside_fences(markdown_content, lambda previous, line: HEADING_RE.match(line)):
+        if len(section) <= max_chars:
+            pieces.append(section)
+        else:
+            # Section too large on its own: fall back to paragraph boundaries
+            pieces.extend(split_outside_fences(section, lambda previous, line: not previous.strip() and line.strip()))
+    chunks = []
+    current = []
+    current_len = 0
+    for piece in pieces:
+        if current and current_len + len(piece) > max_chars:
+            chunks.append("".join(current))
+            current = []
+            current_len = 0
+        current.append(piece)
+        current_len += len(piece)
+    if current:
+        chunks.append("".join(current))
+    return [chunk for chunk in chunks if chunk.strip()]
+
+def cache_path(cache_dir, extension, *key_parts):
+    """Returns the cache file keyed by a hash of key_parts, or None if caching is disabled."""
+    if not cache_dir:
+        return None
+    digest = hashlib.blake2b(digest_size=16)
+    for index, part in enumerate(key_parts):
+        if index:
+            digest.update(b'\0')
+        digest.update(part.encode('utf-8'))
+    return os.path.join(cache_dir, f"{digest.hexdigest()}{extension}")
+
+def write_cache(cache_file, content):
+    """Stores content in the cache; failures only cost a future cache miss."""
+    cache_dir = os.path.dirname(cache_file)
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        # Write beside the final path and rename into place, so an interrupted
+        # write never leaves a truncated entry behind
+        fd, temp_path = tempfile.mkstemp(dir=cache_dir, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                f.write(content)
+            os.replace(temp_path, cache_file)
+        except BaseException:
+            os.unlink(temp_path)
+            raise
+    except OSError as e:
+        print(f"Warning: Could not write cache file '{cache_file}': {e}", file=sys.stderr)
@@ -1,13 +1,13 @@
 #!/usr/bin/env python3
 from pathlib import Path
 import os
+import json
 import pandas as pd
 import openai
 from dotenv import load_dotenv
 from supabase import create_client, Client
 import time
 import unicodedata
-import re
 
 # Set up paths
 SCRIPT_DIR = Path(__file__).resolve().parent
@@ -37,6 +37,14 @@ OUTPUT_CSV = PROJECT_ROOT / 'output' / 'openai_embeddings.csv'
 TABLE_NAME = 'Embedded_propositions'
 EMBEDDING_COL = 'Embeddings_OpenAI'  # Should be vector(1536) in Supabase
 
+# Problematic Unicode punctuation mapped to ASCII in one str.translate pass
+ASCII_PUNCTUATION = str.maketrans({
+    '\u2018': "'", '\u2019': "'",  # Smart single quotes
+    '\u201C': '"', '\u201D': '"',  # Smart double quotes
+    '\u2026': '...',                # Ellipsis
+    '\u2013': '-', '\u2014': '-',  # En and em dashes
+})
+
 # Ensure output directory exists
 OUTPUT_CSV.parent.mkdir(parents=True, exist_ok=True)
 
@@ -110,7 +118,6 @@ def update_rows(df, embeddings):
             # METHOD 2: Try with JSON string
             try:
                 print("  Attempting update with JSON string...")
-                import json
                 embedding_json = json.dumps(embedding)
                 resp = supabase.table(TABLE_NAME).update({EMBEDDING_COL: embedding_json}).eq('id', row['id']).execute()
                 print(f"  SUCCESS: Updated with JSON string")
@@ -165,13 +172,10 @@ def filter_valid_texts(batch):
             # Normalize Unicode characters
             cleaned_text = unicodedata.normalize('NFKD', text)
             # Replace common problematic Unicode quotes and apostrophes with ASCII versions
-            cleaned_text = re.sub(r'[\u2018\u2019]', "'", cleaned_text)  # Smart single quotes
-            cleaned_text = re.sub(r'[\u201C\u201D]', '"', cleaned_text)  # Smart double quotes
-            cleaned_text = re.sub(r'\u2026', '...', cleaned_text)  # Ellipsis
-            cleaned_text = re.sub(r'\u2013|\u2014', '-', cleaned_text)  # En and em dashes
+            cleaned_text = cleaned_text.translate(ASCII_PUNCTUATION)
             
             # If you want even more aggressive cleaning
-            cleaned_text = re.sub(r'[^\x00-\x7F]+', '', cleaned_text)  # Remove any remaining non-ASCII characters
+            cleaned_text = cleaned_text.encode('ascii', 'ignore').decode('ascii')  # Remove any remaining non-ASCII characters
             
             valid_indices.append(idx)
             valid_texts.append(cleaned_text)